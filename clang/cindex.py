@@ -63,6 +63,8 @@ call is efficient.
 # o implement additional SourceLocation, SourceRange, and File methods.
 
 from ctypes import *
+from array import array
+from bisect import bisect_left
 from common import error_message
 import platform
 
@@ -131,6 +133,24 @@ class _CXString(Structure):
         assert isinstance(res, _CXString)
         return _CXString_getCString(res)
 
+# Strings that are asked for over and over again, looked up by the pointers
+# they belong to. The pointers are only valid for as long as the translation
+# unit they come from, so the tables are cleared when a translation unit is
+# disposed of or reparsed.
+_file_names = {}
+_spellings = {}
+_displaynames = {}
+
+def _intern_string(s):
+    if s is None:
+        return None
+    return intern(s)
+
+def _clear_string_tables():
+    _file_names.clear()
+    _spellings.clear()
+    _displaynames.clear()
+
 class SourceLocation(Structure):
     """
     A SourceLocation represents a particular location within a source file.
@@ -313,7 +333,6 @@ class CursorKind(object):
 
     # The unique kind objects, indexed by id.
     _kinds = []
-    _name_map = None
 
     def __init__(self, value):
         if value >= len(CursorKind._kinds):
@@ -322,7 +341,6 @@ class CursorKind(object):
             raise ValueError,'CursorKind already loaded'
         self.value = value
         CursorKind._kinds[value] = self
-        CursorKind._name_map = None
 
     def from_param(self):
         return self.value
@@ -336,12 +354,12 @@ class CursorKind(object):
     @property
     def name(self):
         """Get the enumeration name of this cursor kind."""
-        if self._name_map is None:
-            self._name_map = {}
-            for key,value in CursorKind.__dict__.items():
-                if isinstance(value,CursorKind):
-                    self._name_map[value] = key
-        return self._name_map[self]
+        return _cursor_kind_names[self.value]
+
+    @property
+    def lower_name(self):
+        """Get the enumeration name of this cursor kind in lower case."""
+        return _cursor_kind_lower_names[self.value]
 
     @staticmethod
     def from_id(id):
@@ -356,7 +374,9 @@ class CursorKind(object):
 
     def is_declaration(self):
         """Test if this is a declaration kind."""
-        return CursorKind_is_decl(self)
+        if not hasattr(self, '_is_declaration'):
+            self._is_declaration = CursorKind_is_decl(self)
+        return self._is_declaration
 
     def is_reference(self):
         """Test if this is a reference kind."""
@@ -857,6 +877,16 @@ CursorKind.MACRO_DEFINITION = CursorKind(501)
 CursorKind.MACRO_INSTANTIATION = CursorKind(502)
 CursorKind.INCLUSION_DIRECTIVE = CursorKind(503)
 
+def _get_kind_names(cls):
+    names = [None] * len(cls._kinds)
+    for key,value in cls.__dict__.items():
+        if isinstance(value,cls):
+            names[value.value] = key
+    return names, [name and name.lower() for name in names]
+
+# The enumeration names of the kinds, indexed by id
+_cursor_kind_names, _cursor_kind_lower_names = _get_kind_names(CursorKind)
+
 
 class CXXAccessSpecifier:
     def __init__(self, name, kind):
@@ -895,10 +925,15 @@ class Cursor(Structure):
     _fields_ = [("_kind_id", c_int), ("xdata", c_int), ("data", c_void_p * 3)]
 
     def __eq__(self, other):
-        return Cursor_eq(self, other)
+        return isinstance(other, Cursor) and Cursor_eq(self, other)
 
     def __ne__(self, other):
-        return not Cursor_eq(self, other)
+        return not self == other
+
+    def __hash__(self):
+        # Cursors that clang_equalCursors considers equal always share their
+        # kind and the pointers _cursor_key is made of
+        return hash(_cursor_key(self))
 
     def is_definition(self):
         """
@@ -991,6 +1026,36 @@ class Cursor(Structure):
     def get_cxxmethod_is_static(self):
         return _clang_CXXMethod_isStatic(self)
 
+    def get_cxxmethod_is_virtual(self):
+        return _clang_CXXMethod_isVirtual(self)
+
+    def get_cxxmethod_is_const(self):
+        """
+        Return whether a C++ member function is declared const, or None if
+        this version of libclang can't tell.
+        """
+        if _clang_CXXMethod_isConst is None:
+            return None
+        return _clang_CXXMethod_isConst(self)
+
+    def get_function_is_variadic(self):
+        """
+        Return whether a function or method takes a variable number of
+        arguments, or None if this version of libclang can't tell.
+        """
+        if _clang_Cursor_isVariadic is None:
+            return None
+        return _clang_Cursor_isVariadic(self)
+
+    def get_cxxmethod_is_pure_virtual(self):
+        """
+        Return whether a C++ member function is pure virtual, or None if this
+        version of libclang can't tell.
+        """
+        if _clang_CXXMethod_isPureVirtual is None:
+            return None
+        return _clang_CXXMethod_isPureVirtual(self)
+
     def get_referenced_name_range(self):
         return _clang_getCursorReferenceNameRange(self, 2, 0)
 
@@ -1013,7 +1078,11 @@ class Cursor(Structure):
             # this, for consistency with clang_getCursorUSR.
             return None
         if not hasattr(self, '_spelling'):
-            self._spelling = Cursor_spelling(self)
+            # Looked up by the declaration pointed at
+            key = self.data[0]
+            if key not in _spellings:
+                _spellings[key] = _intern_string(Cursor_spelling(self))
+            self._spelling = _spellings[key]
         return self._spelling
 
     @property
@@ -1026,7 +1095,13 @@ class Cursor(Structure):
         class template specialization.
         """
         if not hasattr(self, '_displayname'):
-            self._displayname = Cursor_displayname(self)
+            if self.kind.is_declaration():
+                key = self.data[0]
+                if key not in _displaynames:
+                    _displaynames[key] = _intern_string(Cursor_displayname(self))
+                self._displayname = _displaynames[key]
+            else:
+                self._displayname = Cursor_displayname(self)
         return self._displayname
 
     @property
@@ -1039,6 +1114,16 @@ class Cursor(Structure):
             self._loc = Cursor_loc(self)
         return self._loc
 
+    def get_file_pointer(self):
+        """
+        Return the address of the CXFile the cursor is located in, or None.
+        Unlike location.file this creates no File object, so it is cheap to
+        use as a key for the file of a cursor.
+        """
+        f = c_void_p()
+        SourceLocation_file(self.location, byref(f), None, None, None)
+        return f.value
+
     @property
     def extent(self):
         """
@@ -1079,25 +1164,27 @@ class Cursor(Structure):
         """Return an iterator for accessing the children of this cursor."""
 
         # FIXME: Expose iteration from CIndex, PR6125.
-        def visitor(child, parent, children):
-            # FIXME: Document this assertion in API.
-            # FIXME: There should just be an isNull method.
-            if isWin64:
-                _child = Cursor()
-                #_fields_ = [("_kind_id", c_int), ("xdata", c_int), ("data", c_void_p * 3)]
-
-                _child._kind_id = child[0]._kind_id #dealing with pointers on Win64
-                _child.xdata = child[0].xdata
-                _child.data = child[0].data
-                children.append(_child)
-            else:
-                assert child != Cursor_null()
-                children.append(child)
-            return 1 # continue
         children = []
-        Cursor_visit(self, Cursor_visit_callback(visitor), children)
+        Cursor_visit(self, _children_visitor_callback, children)
         return children
 
+    def get_descendants(self, kinds=None, prune=None):
+        """
+        Return an iterator over all the cursors below this one, in pre-order,
+        as (depth, parent, cursor) tuples. The children of this cursor are at
+        depth 1.
+
+        Only cursors with a kind in kinds are returned if it is given, but the
+        others are still descended into. If prune(depth, parent, cursor)
+        returns True, the children of that cursor are skipped.
+
+        The whole traversal is a single clang_visitChildren call, so the
+        cursors are collected before the first one is returned.
+        """
+        walk = _CursorWalk(self, kinds, prune)
+        Cursor_visit(self, _descendants_visitor_callback, walk)
+        return iter(walk.result)
+
     def get_returned_pointer_level(self, curr=0):
         ret = 0
         type = None
@@ -1342,7 +1429,6 @@ class TypeKind(object):
 
     # The unique kind objects, indexed by id.
     _kinds = []
-    _name_map = None
 
     def __init__(self, value):
         if value >= len(TypeKind._kinds):
@@ -1351,7 +1437,6 @@ class TypeKind(object):
             raise ValueError,'TypeKind already loaded'
         self.value = value
         TypeKind._kinds[value] = self
-        TypeKind._name_map = None
 
     def from_param(self):
         return self.value
@@ -1359,12 +1444,12 @@ class TypeKind(object):
     @property
     def name(self):
         """Get the enumeration name of this cursor kind."""
-        if self._name_map is None:
-            self._name_map = {}
-            for key,value in TypeKind.__dict__.items():
-                if isinstance(value,TypeKind):
-                    self._name_map[value] = key
-        return self._name_map[self]
+        return _type_kind_names[self.value]
+
+    @property
+    def lower_name(self):
+        """Get the enumeration name of this type kind in lower case."""
+        return _type_kind_lower_names[self.value]
 
     @staticmethod
     def from_id(id):
@@ -1424,12 +1509,23 @@ TypeKind.FUNCTIONNOPROTO = TypeKind(110)
 TypeKind.FUNCTIONPROTO = TypeKind(111)
 TypeKind.CONSTANTARRAY = TypeKind(112)
 
+_type_kind_names, _type_kind_lower_names = _get_kind_names(TypeKind)
+
 class Type(Structure):
     """
     The type of an element in the abstract syntax tree.
     """
     _fields_ = [("_kind_id", c_int), ("data", c_void_p * 2)]
 
+    def __eq__(self, other):
+        return isinstance(other, Type) and Type_equal(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self._kind_id, self.data[0], self.data[1]))
+
     @property
     def kind(self):
         """Return the kind of this type."""
@@ -1815,6 +1911,7 @@ class TranslationUnit(ClangObject):
 
     def __del__(self):
         if self.doDispose:
+            _clear_string_tables()
             TranslationUnit_dispose(self)
 
     @property
@@ -1875,6 +1972,9 @@ class TranslationUnit(ClangObject):
         as unsaved_files, the first items should be the filenames to be mapped
         and the second should be the contents to be substituted for the
         file. The contents may be passed as strings or file objects.
+
+        Returns False if the reparse failed, in which case the translation
+        unit can no longer be used.
         """
         unsaved_files_array = 0
         if len(unsaved_files):
@@ -1884,9 +1984,19 @@ class TranslationUnit(ClangObject):
                 unsaved_files_array[i].name = name
                 unsaved_files_array[i].contents = value
                 unsaved_files_array[i].length = len(value)
-        ptr = TranslationUnit_reparse(self, len(unsaved_files),
+        _clear_string_tables()
+        ret = TranslationUnit_reparse(self, len(unsaved_files),
                                       unsaved_files_array,
                                       options)
+        return ret == 0
+
+    def save(self, path, options = 0):
+        """
+        Save the translation unit to the given AST file, from which it can
+        later be loaded again with Index.read. Returns True on success.
+        """
+        return TranslationUnit_save(self, path, options) == 0
+
     def codeComplete(self, path, line, column, unsaved_files = [], options = 0):
         """
         Code complete in this translation unit.
@@ -1918,10 +2028,23 @@ class File(ClangObject):
     translation unit.
     """
 
+    def __eq__(self, other):
+        return isinstance(other, File) and hash(self) == hash(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        # The same file is always represented by the same CXFile pointer
+        return addressof(self.obj.contents)
+
     @property
     def name(self):
         """Return the complete file and path name of the file."""
-        return _CXString_getCString(File_name(self))
+        key = hash(self)
+        if key not in _file_names:
+            _file_names[key] = _intern_string(_CXString_getCString(File_name(self)))
+        return _file_names[key]
 
     @property
     def time(self):
@@ -1972,10 +2095,23 @@ if isWin64:
                                    POINTER(c_uint), POINTER(c_uint),
                                    POINTER(c_uint)]
 
+# The same function, only asking for the file, as a plain pointer. Looked up
+# with [] so that the prototype above isn't changed.
+SourceLocation_file = lib["clang_getInstantiationLocation"]
+SourceLocation_file.argtypes = [SourceLocation, POINTER(c_void_p),
+                                c_void_p, c_void_p, c_void_p]
+if isWin64:
+    SourceLocation_file.argtypes = [POINTER(SourceLocation), POINTER(c_void_p),
+                                    c_void_p, c_void_p, c_void_p]
+
 _clang_getLocation = lib.clang_getLocation
 _clang_getLocation.argtypes = [TranslationUnit, File, c_uint, c_uint]
 _clang_getLocation.restype = SourceLocation
 
+_clang_getLocationForOffset = lib.clang_getLocationForOffset
+_clang_getLocationForOffset.argtypes = [TranslationUnit, File, c_uint]
+_clang_getLocationForOffset.restype = SourceLocation
+
 
 # Source Range Functions
 SourceRange_getRange = lib.clang_getRange
@@ -2167,6 +2303,37 @@ _clang_CXXMethod_isStatic.restype = c_int
 if isWin64:
     _clang_CXXMethod_isStatic.argtypes = [POINTER(Cursor)]
 
+_clang_CXXMethod_isVirtual = lib.clang_CXXMethod_isVirtual
+_clang_CXXMethod_isVirtual.argtypes = [Cursor]
+_clang_CXXMethod_isVirtual.restype = c_int
+if isWin64:
+    _clang_CXXMethod_isVirtual.argtypes = [POINTER(Cursor)]
+
+# Only exported by newer versions of libclang
+_clang_CXXMethod_isConst = None
+if hasattr(lib, "clang_CXXMethod_isConst"):
+    _clang_CXXMethod_isConst = lib.clang_CXXMethod_isConst
+    _clang_CXXMethod_isConst.argtypes = [Cursor]
+    _clang_CXXMethod_isConst.restype = c_uint
+    if isWin64:
+        _clang_CXXMethod_isConst.argtypes = [POINTER(Cursor)]
+
+_clang_Cursor_isVariadic = None
+if hasattr(lib, "clang_Cursor_isVariadic"):
+    _clang_Cursor_isVariadic = lib.clang_Cursor_isVariadic
+    _clang_Cursor_isVariadic.argtypes = [Cursor]
+    _clang_Cursor_isVariadic.restype = c_uint
+    if isWin64:
+        _clang_Cursor_isVariadic.argtypes = [POINTER(Cursor)]
+
+_clang_CXXMethod_isPureVirtual = None
+if hasattr(lib, "clang_CXXMethod_isPureVirtual"):
+    _clang_CXXMethod_isPureVirtual = lib.clang_CXXMethod_isPureVirtual
+    _clang_CXXMethod_isPureVirtual.argtypes = [Cursor]
+    _clang_CXXMethod_isPureVirtual.restype = c_uint
+    if isWin64:
+        _clang_CXXMethod_isPureVirtual.argtypes = [POINTER(Cursor)]
+
 _clang_getCursorResultType = lib.clang_getCursorResultType
 _clang_getCursorResultType.argtypes = [Cursor]
 _clang_getCursorResultType.restype = Type
@@ -2183,6 +2350,73 @@ if isWin64:
     Cursor_visit_callback = CFUNCTYPE(c_int, POINTER(Cursor), POINTER(Cursor), py_object)
     Cursor_visit.argtypes = [POINTER(Cursor), Cursor_visit_callback, py_object]
 
+def _copy_cursor(cursor):
+    # Cursors are passed by pointer on Win64, and the cursor pointed at
+    # doesn't outlive the callback
+    ret = Cursor()
+    ret._kind_id = cursor[0]._kind_id
+    ret.xdata = cursor[0].xdata
+    ret.data = cursor[0].data
+    return ret
+
+def _children_visitor(child, parent, children):
+    # FIXME: Document this assertion in API.
+    # FIXME: There should just be an isNull method.
+    if isWin64:
+        children.append(_copy_cursor(child))
+    else:
+        assert child != Cursor_null()
+        children.append(child)
+    return 1 # CXChildVisit_Continue
+
+class _CursorWalk(object):
+    """State of a Cursor.get_descendants traversal."""
+
+    def __init__(self, cursor, kinds, prune):
+        self.kinds = None
+        if kinds is not None:
+            self.kinds = set([kind.value for kind in kinds])
+        self.prune = prune
+        self.result = []
+        # The cursors currently being descended into, and their keys, as the
+        # callback only tells which cursor is the parent
+        self.parents = [cursor]
+        self.keys = [_cursor_key(cursor)]
+
+def _cursor_key(cursor):
+    # The parent passed to a visitor is not always bitwise identical to the
+    # cursor visited before: declarations may differ in their
+    # "first in declaration group" bit (data[1]), expressions and statements
+    # in the declaration they are part of (data[0]).
+    kind = cursor._kind_id
+    if 100 <= kind < 300:
+        return (kind, cursor.data[1])
+    data = cursor.data[:]
+    if 1 <= kind < 100 or kind >= 600:
+        return (kind, data[0], data[2])
+    return (kind, data[0], data[1], data[2])
+
+def _descendants_visitor(child, parent, walk):
+    if isWin64:
+        child = _copy_cursor(child)
+        parent = _copy_cursor(parent)
+    key = _cursor_key(parent)
+    while walk.keys[-1] != key:
+        walk.keys.pop()
+        walk.parents.pop()
+    depth = len(walk.keys)
+    parent = walk.parents[-1]
+    if walk.kinds is None or child._kind_id in walk.kinds:
+        walk.result.append((depth, parent, child))
+    if walk.prune is not None and walk.prune(depth, parent, child):
+        return 1 # CXChildVisit_Continue
+    walk.keys.append(_cursor_key(child))
+    walk.parents.append(child)
+    return 2 # CXChildVisit_Recurse
+
+_children_visitor_callback = Cursor_visit_callback(_children_visitor)
+_descendants_visitor_callback = Cursor_visit_callback(_descendants_visitor)
+
 Cursor_getOverridden = lib.clang_getOverriddenCursors
 Cursor_getOverridden.argtypes = [Cursor, POINTER(POINTER(Cursor)), POINTER(c_int)]
 if isWin64:
@@ -2199,6 +2433,12 @@ Type_get_canonical.errcheck = Type.from_result
 if isWin64:
     Type_get_canonical.argtypes = [POINTER(Type)]
 
+Type_equal = lib.clang_equalTypes
+Type_equal.argtypes = [Type, Type]
+Type_equal.restype = c_uint
+if isWin64:
+    Type_equal.argtypes = [POINTER(Type), POINTER(Type)]
+
 Type_is_const_qualified = lib.clang_isConstQualifiedType
 Type_is_const_qualified.argtypes = [Type]
 Type_is_const_qualified.restype = bool
@@ -2267,6 +2507,10 @@ TranslationUnit_reparse = lib.clang_reparseTranslationUnit
 TranslationUnit_reparse.argtypes = [TranslationUnit, c_int, c_void_p, c_int]
 TranslationUnit_reparse.restype = c_int
 
+TranslationUnit_save = lib.clang_saveTranslationUnit
+TranslationUnit_save.argtypes = [TranslationUnit, c_char_p, c_uint]
+TranslationUnit_save.restype = c_int
+
 TranslationUnit_codeComplete = lib.clang_codeCompleteAt
 TranslationUnit_codeComplete.argtypes = [TranslationUnit, c_char_p, c_int,
                                          c_int, c_void_p, c_int, c_int]
@@ -2484,7 +2728,9 @@ class Token(object):
 class TokenCollection(object):
     """Holds a C array of TokenImpl objects.
 
-    These are presented to the outside by Token objects.
+    These are presented to the outside by Token objects, which are only
+    created when a token is accessed. The kinds and spellings of a number
+    of tokens can be had without creating any.
     """
 
     def __init__(self, translation_unit, source_range, token_arr, num_tokens):
@@ -2492,7 +2738,8 @@ class TokenCollection(object):
         self.source_range = source_range
         self._token_arr = token_arr
         self._num_tokens = num_tokens
-        self.tokens = tuple(Token(self.translation_unit, self._token_arr[i], self) for i in range(self._num_tokens.value))
+        self._tokens = [None] * num_tokens.value
+        self._spellings = [None] * num_tokens.value
         self.cursors = None
 
     def annotate(self):
@@ -2502,14 +2749,47 @@ class TokenCollection(object):
     def get_cursor(self, idx):
         return self._cursors[idx]
 
+    def get_int_data(self, field):
+        """
+        Return field (0 to 3) of the int_data of every CXToken, read
+        straight from the array. Field 0 is the kind and 1 the raw location.
+        """
+        count = self._num_tokens.value
+        if not count:
+            return []
+        stride = sizeof(TokenImpl) / sizeof(c_uint)
+        data = (c_uint * (count * stride)).from_address(addressof(self._token_arr.contents))
+        return data[field::stride]
+
+    def kinds(self):
+        """Return the TokenKinds of all the tokens."""
+        return [TokenKind._kinds[kind] for kind in self.get_int_data(0)]
+
+    def spellings(self, start=0, stop=None):
+        """Return the spellings of tokens start to stop."""
+        start, stop, step = slice(start, stop).indices(len(self))
+        for i in range(start, stop):
+            if self._spellings[i] is None:
+                self._spellings[i] = Token_spelling(self.translation_unit, self._token_arr[i])
+        return self._spellings[start:stop]
+
     def __iter__(self):
-        return iter(self.tokens)
+        for i in range(len(self)):
+            yield self[i]
 
     def __getitem__(self, i):
-        return self.tokens[i]
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError, 'Token index out of range'
+        if self._tokens[i] is None:
+            self._tokens[i] = Token(self.translation_unit, self._token_arr[i], self)
+        return self._tokens[i]
 
     def __len__(self):
-        return len(self.tokens)
+        return len(self._tokens)
 
     def __del__(self):
         _clang_disposeTokens(self.translation_unit, self._token_arr, self._num_tokens)
@@ -2523,6 +2803,78 @@ def tokenize(translation_unit, source_range):
     return TokenCollection(translation_unit, source_range, tokens, num_tokens)
 
 
+class FileTokens(object):
+    """
+    All the tokens of a file, tokenized at once.
+
+    The kinds and offsets of the tokens are kept in arrays, which makes
+    finding the tokens within a source range a binary search. Spellings are
+    only fetched when asked for.
+    """
+
+    def __init__(self, translation_unit, location):
+        """
+        Tokenize the file that location is in. A file included more than once
+        is tokenized separately for each inclusion.
+        """
+        if location.int_data & (1 << 31):
+            raise ValueError, 'Location is within a macro expansion'
+        self.translation_unit = translation_unit
+        self.file = location.file
+        # The raw encoding of a location is that of the start of its file plus
+        # the offset into the file
+        start = SourceLocation()
+        start.ptr_data = location.ptr_data
+        start.int_data = location.int_data - location.offset
+        self._base = start.int_data
+
+        # Lines past the end are clamped to the last character of the file
+        first = _clang_getLocationForOffset(translation_unit, self.file, 0)
+        last = _clang_getLocation(translation_unit, self.file, 1 << 30, 1)
+        self._size = last.int_data - first.int_data + 1
+        end = SourceLocation()
+        end.ptr_data = location.ptr_data
+        end.int_data = self._base + self._size
+
+        self.tokens = tokenize(translation_unit, SourceRange.from_locations(start, end))
+        self._kinds = array('B', self.tokens.get_int_data(0))
+        self._offsets = array('I', [loc - self._base for loc in self.tokens.get_int_data(1)])
+
+    def __len__(self):
+        return len(self._kinds)
+
+    def find(self, source_range):
+        """
+        Return the (start, stop) indices of the tokens starting within
+        source_range, or None if the range isn't a range of this file.
+        """
+        begin = source_range.begin_int_data - self._base
+        end = source_range.end_int_data - self._base
+        if begin < 0 or end > self._size or begin > end:
+            return None
+        return bisect_left(self._offsets, begin), bisect_left(self._offsets, end)
+
+    def kind(self, i):
+        """Return the TokenKind of token i."""
+        return TokenKind._kinds[self._kinds[i]]
+
+    def kinds(self, start, stop):
+        """Return the TokenKinds of tokens start to stop."""
+        return [TokenKind._kinds[kind] for kind in self._kinds[start:stop]]
+
+    def offset(self, i):
+        """Return the file offset of token i."""
+        return self._offsets[i]
+
+    def spelling(self, i):
+        """Return the spelling of token i."""
+        return self.tokens.spellings(i, i + 1)[0]
+
+    def spellings(self, start, stop):
+        """Return the spellings of tokens start to stop."""
+        return self.tokens.spellings(start, stop)
+
+
 Token_kind = lib.clang_getTokenKind
 Token_kind.argtypes = [TokenImpl]
 Token_kind.restype = TokenKind
@@ -2554,4 +2906,4 @@ _clang_disposeTokens.argtypes = [TranslationUnit, POINTER(TokenImpl), c_uint]
 
 __all__ = ['Index', 'TranslationUnit', 'Cursor', 'CursorKind', 'Type', 'TypeKind',
            'Diagnostic', 'FixIt', 'CodeCompletionResults', 'SourceRange',
-           'SourceLocation', 'File', 'Token', 'TokenKind']
+           'SourceLocation', 'File', 'Token', 'TokenKind', 'FileTokens']
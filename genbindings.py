@@ -22,80 +22,322 @@ from clang import cindex
 import sys
 import re
 import json
+import collections
 import os.path
 import copy
+import shutil
+import tempfile
+import hashlib
+import multiprocessing
+import time
 
 
-if len(sys.argv) < 2:
-    print "usage: %s configfile.json"
-    sys.exit(1)
+config = {}
+config_path = None
 
-
-f = open(sys.argv[1])
-data = f.read()
-data = re.sub(r"//[^\n]*\n", "\n", data)
-config = json.loads(data)
-f.close()
-
-if "object_types" in config:
-    arr = config["object_types"]
-    config["object_types"] = {}
-    for name in arr:
-        config["object_types"][re.compile(name)] = arr[name]
-
-def get(name, default=None, conf=config):
+def get(name, default=None, conf=None):
+    if conf is None:
+        conf = config
     if name in conf:
         return conf[name]
     else:
         return default
 
-fir = get("file_include_regex", None)
-fer = get("file_exclude_regex", None)
-mir = get("method_include_regex", None)
-mer = get("method_exclude_regex", None)
-oir = get("object_include_regex", None)
-oer = get("object_exclude_regex", None)
-mfir = get("field_include_regex", None)
-mfer = get("field_exclude_regex", None)
-generic_regex = get("generic_wrapper_regex", None)
-maahr = get("method_argument_auto_handle_regex", None)
-mrahr = get("method_return_auto_handle_regex", None)
-
-fir = re.compile(fir) if fir else fir
-fer = re.compile(fer) if fer else fer
-mir = re.compile(mir) if mir else mir
-mer = re.compile(mer) if mer else mer
-oir = re.compile(oir) if oir else oir
-oer = re.compile(oer) if oer else oer
-mfir = re.compile(mfir) if mfir else mfir
-mfer = re.compile(mfer) if mfer else mfer
-maahr = re.compile(maahr) if maahr else maahr
-mrahr = re.compile(mrahr) if mrahr else mrahr
-generic_regex = re.compile(generic_regex) if generic_regex else generic_regex
-
-verbose = get("verbose", False)
-doassert = get("assert", True)
-keep_unknowns = get("keep_unknowns", False)
-output_filename = get("output_filename", None)
-funcname = get("function_name", "RegisterMyTypes")
-
-for arg in sys.argv[2:]:
-    if arg == "-v":
-        verbose = True
-    elif arg == "-noassert":
-        doassert = False
-
-generic_wrappers = []
-
-index = cindex.Index.create()
-
-clang_args = get("clang_args", [])
-clang_args.insert(0, "-I%s/clang/include" % os.path.dirname(os.path.abspath(__file__)))
-new_args = []
-for arg in clang_args:
-    new_args.append(arg.replace("${this_file_path}", os.path.dirname(os.path.abspath(sys.argv[1]))))
-clang_args = new_args
-tu = index.parse(None, clang_args, [], 13)
+def expand_path(path):
+    return path.replace("${this_file_path}", config_path)
+
+def read_config(filename):
+    f = open(filename)
+    data = f.read()
+    data = re.sub(r"//[^\n]*\n", "\n", data)
+    f.close()
+    # Keep the order of "object_types", as the first matching rule wins
+    return json.loads(data, object_pairs_hook=collections.OrderedDict)
+
+def get_config_files(filenames):
+    # A configuration file with a "configs" list stands for the
+    # configuration files listed in it
+    ret = []
+    for filename in filenames:
+        conf = read_config(filename)
+        if "configs" in conf:
+            path = os.path.dirname(os.path.abspath(filename))
+            names = [os.path.join(path, name.replace("${this_file_path}", path)) for name in conf["configs"]]
+            ret.extend(get_config_files(names))
+        else:
+            ret.append(filename)
+    return ret
+
+def load_config(filename, options=[]):
+    global config
+    global config_path
+    global fir, fer, mir, mer, oir, oer, mfir, mfer
+    global generic_regex, maahr, mrahr
+    global verbose, doassert, keep_unknowns, output_filename, funcname
+    global cache_dir, cache_max_size, jobs, header_only, watch
+    global object_type_rules, object_type_matches
+
+    config = read_config(filename)
+    config_path = os.path.dirname(os.path.abspath(filename))
+
+    object_type_rules = [(re.compile(name), conf) for name, conf in get("object_types", {}).items()]
+    object_type_matches = {}
+
+    fir = get("file_include_regex", None)
+    fer = get("file_exclude_regex", None)
+    mir = get("method_include_regex", None)
+    mer = get("method_exclude_regex", None)
+    oir = get("object_include_regex", None)
+    oer = get("object_exclude_regex", None)
+    mfir = get("field_include_regex", None)
+    mfer = get("field_exclude_regex", None)
+    generic_regex = get("generic_wrapper_regex", None)
+    maahr = get("method_argument_auto_handle_regex", None)
+    mrahr = get("method_return_auto_handle_regex", None)
+
+    fir = re.compile(fir) if fir else fir
+    fer = re.compile(fer) if fer else fer
+    mir = re.compile(mir) if mir else mir
+    mer = re.compile(mer) if mer else mer
+    oir = re.compile(oir) if oir else oir
+    oer = re.compile(oer) if oer else oer
+    mfir = re.compile(mfir) if mfir else mfir
+    mfer = re.compile(mfer) if mfer else mfer
+    maahr = re.compile(maahr) if maahr else maahr
+    mrahr = re.compile(mrahr) if mrahr else mrahr
+    generic_regex = re.compile(generic_regex) if generic_regex else generic_regex
+
+    verbose = get("verbose", False)
+    doassert = get("assert", True)
+    keep_unknowns = get("keep_unknowns", False)
+    output_filename = get("output_filename", None)
+    funcname = get("function_name", "RegisterMyTypes")
+    jobs = get("jobs", multiprocessing.cpu_count())
+    header_only = get("header_only", False)
+    watch = False
+
+    cache_dir = get("cache_dir", None)
+    cache_max_size = get("cache_max_size", 256)
+    if cache_dir:
+        cache_dir = expand_path(cache_dir)
+    if output_filename != None:
+        output_filename = expand_path(output_filename)
+
+    for arg in options:
+        if arg == "-v":
+            verbose = True
+        elif arg == "-noassert":
+            doassert = False
+        elif arg == "-w":
+            watch = True
+
+def get_translation_units():
+    # "clang_args" is either the argument list of a single translation unit,
+    # or a list of such lists. Each of the "source_files" is compiled as a
+    # translation unit of its own using those arguments.
+    clang_args = get("clang_args", [])
+    if len(clang_args) and isinstance(clang_args[0], list):
+        arg_sets = clang_args
+    else:
+        arg_sets = [clang_args]
+    sources = get("source_files", None)
+    if sources:
+        arg_sets = [args + [source] for args in arg_sets for source in sources]
+
+    include = "-I%s/clang/include" % os.path.dirname(os.path.abspath(__file__))
+    arg_sets = [[include] + [expand_path(arg) for arg in args] for args in arg_sets]
+    if header_only:
+        # The source files are replaced by an umbrella file including the
+        # headers, so argument sets that differed only in those are the same
+        unique = []
+        for args in arg_sets:
+            args = [arg for arg in args if not is_source_file(arg)]
+            if args not in unique:
+                unique.append(args)
+        arg_sets = unique
+    return arg_sets
+
+source_extensions = [".c", ".cc", ".cpp", ".cxx", ".c++", ".m", ".mm"]
+header_extensions = [".h", ".hh", ".hpp", ".hxx"]
+
+def is_source_file(arg):
+    return not arg.startswith("-") and os.path.splitext(arg)[1].lower() in source_extensions
+
+# The umbrella files built so far, keyed by the arguments and file regexes
+# they were built for
+umbrellas = {}
+
+def get_umbrella(args):
+    # Collects the headers in the include paths that the file regexes would
+    # admit, so that libclang never has to see any implementation code.
+    # The headers are included by their absolute paths, as the umbrella file
+    # doesn't live where relative include paths are relative to.
+    key = (tuple(args), fer and fer.pattern, fir and fir.pattern)
+    if key in umbrellas:
+        return umbrellas[key]
+    builtin = os.path.join(os.path.dirname(os.path.abspath(__file__)), "clang", "include")
+    dirs = []
+    for i in range(len(args)):
+        if args[i] == "-I" and i+1 < len(args):
+            dirs.append(args[i+1])
+        elif args[i].startswith("-I") and len(args[i]) > 2:
+            dirs.append(args[i][2:])
+
+    headers = []
+    seen = set()
+    for d in dirs:
+        if os.path.abspath(d) == builtin:
+            continue
+        for root, subdirs, files in os.walk(d):
+            subdirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() not in header_extensions:
+                    continue
+                path = os.path.abspath(os.path.join(root, name))
+                if admit_file(path) is None:
+                    continue
+                real = os.path.realpath(path)
+                if real not in seen:
+                    seen.add(real)
+                    headers.append(path)
+    umbrellas[key] = "".join(["#include \"%s\"\n" % h for h in headers])
+    return umbrellas[key]
+
+index = None
+
+def get_cache_key(args, files):
+    key = hashlib.sha1()
+    for arg in args:
+        key.update("%s\n" % arg)
+    for name in files:
+        key.update("%s\n%r\n" % (name, os.path.getmtime(name)))
+    return key.hexdigest()
+
+def get_dependencies(tu):
+    files = []
+    if os.path.exists(tu.spelling):
+        files.append(tu.spelling)
+    for inc in tu.get_includes():
+        name = inc.include.name
+        if name not in files:
+            files.append(name)
+    return files
+
+def trim_cache():
+    # Least recently used translation units are evicted first, along with
+    # the manifests pointing to them. Manifests left without a translation
+    # unit are removed as well.
+    manifests = {}
+    for name in os.listdir(cache_dir):
+        if name.endswith(".json"):
+            path = os.path.join(cache_dir, name)
+            manifest = read_manifest(path)
+            ast = manifest and manifest["ast"]
+            if not ast or not os.path.exists(os.path.join(cache_dir, ast)):
+                os.remove(path)
+            else:
+                manifests.setdefault(ast, []).append(path)
+    asts = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        if name.endswith(".ast"):
+            path = os.path.join(cache_dir, name)
+            size = os.path.getsize(path)
+            asts.append((os.path.getmtime(path), size, path))
+            total += size
+    asts.sort()
+    while total > cache_max_size*1024*1024 and len(asts):
+        mtime, size, path = asts.pop(0)
+        os.remove(path)
+        for manifest in manifests.get(os.path.basename(path), []):
+            os.remove(manifest)
+        total -= size
+
+def read_manifest(path):
+    # Returns the manifest at path, or None if it can't be used
+    try:
+        f = open(path)
+        manifest = json.load(f)
+        f.close()
+    except (OSError, IOError, ValueError) as e:
+        warn("Couldn't read cache manifest %s - %s" % (path, e))
+        return None
+    if not isinstance(manifest, dict):
+        # Written by an older version, which didn't keep the diagnostics
+        return None
+    return manifest
+
+def get_diagnostics(tu):
+    # Translation units read from the cache don't have the diagnostics of
+    # the parse that created them, so the ones saved with them are used
+    if hasattr(tu, "cached_diagnostics"):
+        return tu.cached_diagnostics
+    return [diag.spelling for diag in tu.diagnostics]
+
+def get_unsaved_files(args):
+    if not header_only:
+        return None, []
+    source = os.path.join(config_path, "genbindings_umbrella.cpp")
+    return source, [(source, get_umbrella(args))]
+
+def parse(args):
+    tu = load(args)
+    if tu is None:
+        raise Exception("Failed to parse %s" % " ".join(args))
+    return tu
+
+def load(args):
+    global index
+    if index is None:
+        index = cindex.Index.create()
+    source, unsaved_files = get_unsaved_files(args)
+    key_args = args
+    if header_only:
+        key_args = args + [source, unsaved_files[0][1]]
+    if not cache_dir:
+        return index.parse(source, args, unsaved_files, 13)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    # The manifest lists the files the last parse with these arguments
+    # depended on, so that their current mtimes can be hashed into the key
+    # without having to parse again. It also keeps the diagnostics of that
+    # parse, which are not saved in the translation unit itself.
+    manifest_path = os.path.join(cache_dir, "%s.json" % get_cache_key(key_args, []))
+    if os.path.exists(manifest_path):
+        manifest = read_manifest(manifest_path)
+        try:
+            if manifest:
+                path = os.path.join(cache_dir, "%s.ast" % get_cache_key(key_args, manifest["files"]))
+                if os.path.exists(path):
+                    tu = index.read(path)
+                    if tu:
+                        os.utime(path, None)
+                        tu.cached_diagnostics = manifest["diagnostics"]
+                        return tu
+        except (OSError, IOError) as e:
+            warn("Couldn't load cached translation unit - %s" % e)
+
+    tu = index.parse(source, args, unsaved_files, 13)
+    if tu:
+        try:
+            files = get_dependencies(tu)
+            path = os.path.join(cache_dir, "%s.ast" % get_cache_key(key_args, files))
+            if tu.save(path):
+                manifest = {
+                    "files": files,
+                    "ast": os.path.basename(path),
+                    "diagnostics": get_diagnostics(tu)
+                }
+                f = open(manifest_path, "w")
+                json.dump(manifest, f)
+                f.close()
+                trim_cache()
+            else:
+                warn("Couldn't save translation unit to %s" % path)
+        except (OSError, IOError) as e:
+            warn("Couldn't cache translation unit - %s" % e)
+    return tu
 
 
 warn_count = 0
@@ -105,11 +347,24 @@ def warn(msg):
     if verbose:
         sys.stderr.write(msg + "\n")
 
+
+type_names = {}
+
 def get_type(type, cursor=None):
-    pointer = type.kind == cindex.TypeKind.POINTER
+    # The names of types are memoized, as the same types tend to be used by
+    # many declarations
+    if cursor is None and type.kind == cindex.TypeKind.CONSTANTARRAY:
+        raise Exception("Constant array, but cursor not provided so can't solve the type")
+    if type not in type_names:
+        type_names[type] = get_type_name(type)
+    return type_names[type]
+
+def get_type_name(type):
+    kind = type.kind
+    pointer = kind == cindex.TypeKind.POINTER
     typename = ""
-    ref = type.kind == cindex.TypeKind.LVALUEREFERENCE
-    if type.kind == cindex.TypeKind.TYPEDEF or type.kind == cindex.TypeKind.RECORD or type.kind == cindex.TypeKind.ENUM:
+    ref = kind == cindex.TypeKind.LVALUEREFERENCE
+    if kind == cindex.TypeKind.TYPEDEF or kind == cindex.TypeKind.RECORD or kind == cindex.TypeKind.ENUM:
         typename = type.get_declaration()
     elif pointer or ref:
         t2 = type.get_pointee()
@@ -117,21 +372,18 @@ def get_type(type, cursor=None):
 
         if typename is None or typename.kind.is_invalid():
             typename = get_type(t2)
-    elif type.kind == cindex.TypeKind.ULONG:
+    elif kind == cindex.TypeKind.ULONG:
         typename = "unsigned long"
-    elif type.kind == cindex.TypeKind.UINT:
+    elif kind == cindex.TypeKind.UINT:
         typename = "unsigned int"
-    elif type.kind == cindex.TypeKind.USHORT:
+    elif kind == cindex.TypeKind.USHORT:
         typename = "unsigned short"
-    elif type.kind == cindex.TypeKind.CONSTANTARRAY:
-        if cursor is None:
-            raise Exception("Constant array, but cursor not provided so can't solve the type")
-
+    elif kind == cindex.TypeKind.CONSTANTARRAY:
         typename = get_type(type.get_array_element_type())
     else:
-        typename = type.kind.name.lower()
+        typename = kind.lower_name
     if typename is None:
-        raise Exception("Typename was None %s" % type.kind)
+        raise Exception("Typename was None %s" % kind)
     elif isinstance(typename, cindex.Cursor):
         if typename.spelling == None:
             raise Exception("Typename was None %s" % type.kind)
@@ -162,7 +414,20 @@ def is_int(literal):
 
 objecttype_scoreboard = {}
 
+# The type uses of each top level declaration, keyed by USR, so that the
+# scoreboard can be rebuilt when declarations from several translation units
+# are merged.
+decl_uses = {}
+current_decl = None
+
 def add_use(typename):
+    if current_decl in decl_uses:
+        decl_uses[current_decl].append(typename)
+    else:
+        decl_uses[current_decl] = [typename]
+    count_use(typename)
+
+def count_use(typename):
     val = (0, 0)
     p = 0
     if "*" in typename:
@@ -173,15 +438,50 @@ def add_use(typename):
         val = objecttype_scoreboard[typename]
     objecttype_scoreboard[typename] = (val[0]+p, val[1]+1-p)
 
+# What each typedef name stands for, and the typedef cursors not looked at
+# yet. Typedefs are only tokenized once get_real_type needs them.
 typedef = {}
+typedef_cursors = {}
+
+def add_typedef(cursor):
+    typedef_cursors.setdefault(cursor.spelling, []).append(cursor)
+
+def set_typedef(name, kind):
+    typedef[name] = kind
+    if name in typedef_cursors:
+        del typedef_cursors[name]
+
+def get_typedef_target(name):
+    if name in typedef_cursors:
+        # The last typedef of a name that can be resolved wins
+        for cursor in reversed(typedef_cursors.pop(name)):
+            n, kind = get_typedef(cursor)
+            if n:
+                typedef[name] = kind
+                break
+    return typedef.get(name)
+
+def resolve_typedef(name):
+    # Follows the typedefs of name to the type they end up at. Every name
+    # on the way is then pointed straight at that type, so that looking any
+    # of them up again takes a single step.
+    chain = []
+    while True:
+        target = get_typedef_target(name)
+        if target is None or target == name or target in chain:
+            break
+        chain.append(name)
+        name = target
+    for n in chain[:-1]:
+        typedef[n] = name
+    return name
 
 def get_real_type(name):
     ptr = "*" in name
     ref = "&" in name
     if ptr or ref:
         name = name[:-1]
-    while name in typedef:
-        name = typedef[name]
+    name = resolve_typedef(name)
 
     if ptr:
         return name + "*"
@@ -190,12 +490,100 @@ def get_real_type(name):
     return name
 
 
+file_tokens = {}
+last_tokens = None
+
+def get_tokens(extent):
+    # Returns the token index of the file extent is in, along with the
+    # (start, stop) range of the tokens of extent in it. Each file is only
+    # tokenized once. Extents from macro expansions have no tokens.
+    global last_tokens
+    if last_tokens is not None:
+        r = last_tokens.find(extent)
+        if r is not None:
+            return last_tokens, r
+    start = extent.start
+    f = start.file
+    if not f:
+        return None, (0, 0)
+    for tokens in file_tokens.get(f, []):
+        r = tokens.find(extent)
+        if r is not None:
+            last_tokens = tokens
+            return tokens, r
+    try:
+        tokens = cindex.FileTokens(tu, start)
+    except ValueError:
+        return None, (0, 0)
+    file_tokens.setdefault(f, []).append(tokens)
+    last_tokens = tokens
+    r = tokens.find(extent)
+    if r is None:
+        return None, (0, 0)
+    return tokens, r
+
+def is_const_type(type):
+    # Whether type, or whatever it points or refers to, is const qualified.
+    # Returns None if libclang can't tell what a pointer points to.
+    while not type.is_const_qualified():
+        kind = type.kind
+        if kind != cindex.TypeKind.POINTER and \
+                kind != cindex.TypeKind.LVALUEREFERENCE and \
+                kind != cindex.TypeKind.RVALUEREFERENCE:
+            return False
+        type = type.get_pointee()
+        if type.kind == cindex.TypeKind.INVALID:
+            return None
+    return True
+
 def is_const(cursor):
-    tokens = cindex.tokenize(tu, cursor.extent)
-    for token in tokens:
-        if token.spelling == "const":
-            return True
-    return False
+    const = is_const_type(cursor.type)
+    if const is None:
+        tokens, (start, stop) = get_tokens(cursor.extent)
+        const = False
+        for i in range(start, stop):
+            if tokens.kind(i) == cindex.TokenKind.KEYWORD and tokens.spelling(i) == "const":
+                const = True
+                break
+    return const
+
+# CXLinkage_External, as returned by Cursor.get_linkage
+EXTERNAL_LINKAGE = 4
+
+def is_variadic(cursor):
+    variadic = cursor.get_function_is_variadic()
+    if variadic is None:
+        # The display name lists the parameters, ending with the ellipsis
+        variadic = cursor.displayname.endswith("...)")
+    return bool(variadic)
+
+def is_const_method(cursor, children):
+    const = cursor.get_cxxmethod_is_const()
+    if const is not None:
+        return const
+
+    # Older versions of libclang can't tell, so look for a trailing const
+    # between the last child before the body and the body itself
+    start = cursor.extent.start
+    end = cursor.extent.end
+    i = 0
+    while i < len(children):
+        if children[i].kind == cindex.CursorKind.PARM_DECL:
+            start = children[i].extent.end
+        if children[i].kind == cindex.CursorKind.COMPOUND_STMT:
+            if i > 0:
+                start = children[i-1].extent.end
+            end = children[i].extent.start
+            break
+        i += 1
+        if i == len(children):
+            break
+        start = children[i-1].extent.end
+
+    tokens, (start, stop) = get_tokens(cindex.SourceRange.from_locations(start, end))
+    if stop - start >= 2 and tokens.spellings(stop - 2, stop) == ["=", "0"]:
+        stop -= 2
+    return stop > start and tokens.spelling(stop - 1) == "const"
 
 as_builtins = {
     "unsigned long": "uint64",
@@ -224,30 +612,33 @@ def get_as_type(name):
     return "%s%s%s" % (name, "@" if ptr else "", "&" if ref else "")
 
 class Type:
-    def __init__(self, kind):
+    # Types are shared by every declaration using them, so they must not be
+    # modified once created, other than to cache their AngelScript name. Use
+    # get_type_record or use_type to get one.
+    def __init__(self, kind, const):
         typename = get_type(kind)
         self.cname = typename
         typename = get_real_type(typename)
         self.resolved = typename
-        add_use(typename)
-        self.const = kind.is_const_qualified()
-        get_as_type(self.resolved)
+        self.const = const
+        self.as_type = None
 
     def __repr__(self):
         return self.cname
 
     def get_as_type(self):
+        if self.as_type is not None:
+            return self.as_type
         as_type = None
-        if "object_types" in config:
-            for regex in config["object_types"]:
-                if regex.search(self.cname) != None:
-                    conf = config["object_types"][regex]
-                    if "as_type" in conf:
-                        as_type = regex.sub(conf["as_type"], self.cname)
-                    break
+        rules = get_object_rules(self.cname)
+        if len(rules):
+            regex, conf = rules[0]
+            if "as_type" in conf:
+                as_type = regex.sub(conf["as_type"], self.cname)
         if as_type == None:
             as_type = get_as_type(self.resolved)
-        return "%s%s" % ("const " if self.const else "", as_type)
+        self.as_type = "%s%s" % ("const " if self.const else "", as_type)
+        return self.as_type
 
     def is_known(self):
         name = self.resolved.replace("*", "").replace("&", "")
@@ -255,21 +646,63 @@ class Type:
             return True
         if name in as_builtins:
             return True
-        if "object_types" in config:
-            for regex in config["object_types"]:
-                if regex.search(self.cname) != None:
-                    return True
-        return False
+        return len(get_object_rules(self.cname)) > 0
 
     def get_c_type(self):
         return "%s%s" % ("const " if self.const else "", self.cname)
 
+type_records = {}
+
+def get_type_record(kind, const=None):
+    # Returns the Type for a clang type, which is only resolved the first
+    # time it is asked for. const defaults to the qualifier of kind itself.
+    key = (kind, const)
+    if key not in type_records:
+        if const is None:
+            const = kind.is_const_qualified()
+        type_records[key] = Type(kind, const)
+    return type_records[key]
+
+def use_type(kind, const=None):
+    # Same as get_type_record, but counts the use towards deciding whether
+    # the type is a reference or a value type, and raises if AngelScript
+    # can't use the type
+    t = get_type_record(kind, const)
+    add_use(t.resolved)
+    get_as_type(t.resolved)
+    return t
+
+def get_field_type(cursor):
+    # The resolved type name of a field. Array fields have no Type record,
+    # as their type can only be resolved given the cursor.
+    if cursor.type.kind == cindex.TypeKind.CONSTANTARRAY:
+        return get_real_type(get_type(cursor.type, cursor))
+    return get_type_record(cursor.type).resolved
+
+
+object_type_rules = []
+object_type_matches = {}
+
+def get_object_rules(name):
+    # Returns the object_types rules matching name, in the order they are
+    # listed in the configuration. Each name is only matched against the
+    # rules once.
+    if name not in object_type_matches:
+        object_type_matches[name] = [(regex, conf) for regex, conf in object_type_rules if regex.search(name)]
+    return object_type_matches[name]
+
+# Whether each object type is a reference type and its flags, filled in by
+# resolve_object_types once all declarations are known
+reference_types = {}
+object_flags = {}
+types_resolved = False
 
 def is_reference_type(name):
-    if "object_types" in config:
-        for regex in config["object_types"]:
-            if regex.search(name) and "reference" in config["object_types"][regex]:
-                return config["object_types"][regex]["reference"]
+    if name in reference_types:
+        return reference_types[name]
+    for regex, conf in get_object_rules(name):
+        if "reference" in conf:
+            return conf["reference"]
     if name in objecttypes:
         ot = objecttypes[name]
         for p in ot.parents:
@@ -281,6 +714,18 @@ def is_reference_type(name):
         return score[0] > score[1]
     return None
 
+def resolve_object_types():
+    global types_resolved
+    # Object types are indexed in the order they are declared, so the
+    # parents of a type are always resolved before the type itself
+    ot = objecttypes.values()
+    ot.sort(cmp=lambda a, b:  cmp(a.index, b.index))
+    for o in ot:
+        reference_types[o.name] = is_reference_type(o.name)
+    for o in ot:
+        object_flags[o.name] = o.get_flags()
+    types_resolved = True
+
 
 operatornamedict = {
     "-operator":       "opNeg",
@@ -321,65 +766,40 @@ operatornamedict = {
     "operator>>>=":    "opUShrAssign",
 }
 class Function(object):
-    def __init__(self, cursor, clazz=None, behaviour=None):
+    def __init__(self, cursor, clazz=None, behaviour=None, children=None):
         self.args = []
+        self.usr = None
+        # The names built by pretty_name, asname and generic_name, keyed by
+        # what they were built for, as name, clazz and behaviour may change.
+        # Cleared by merge, as asname depends on the declarations merged.
+        self.names = {}
+        # Whether the generic wrapper can be a trampoline shared with other
+        # functions, which takes the function as a template argument. Only
+        # functions with external linkage can be template arguments, and the
+        # pointer type of a variadic function can't be spelled out in one.
+        self.shares_wrapper = True
         if cursor is None:
             return
 
-        children = cursor.get_children()
+        if children is None:
+            children = cursor.get_children()
         for child in children:
             if child.kind == cindex.CursorKind.PARM_DECL:
-                t = Type(child.type)
-                t.const = is_const(child)
-                self.args.append(t)
+                self.args.append(use_type(child.type, is_const(child)))
+        self.shares_wrapper = cursor.get_linkage() == EXTERNAL_LINKAGE and not is_variadic(cursor)
 
         self.name = cursor.spelling
-        self.return_type = Type(cursor.result_type)
+        self.usr = cursor.get_usr()
         self.clazz = clazz
         self.const = False
         self.behaviour = behaviour
 
+        const = None
         if self.clazz and not behaviour:
-            start = cursor.extent.start
-            end = cursor.extent.end
-            i = 0
-            while i < len(children):
-                if children[i].kind == cindex.CursorKind.PARM_DECL:
-                    start = children[i].extent.end
-                if children[i].kind == cindex.CursorKind.COMPOUND_STMT:
-                    if i > 0:
-                        start = children[i-1].extent.end
-                    end = children[i].extent.start
-                    break
-                i += 1
-                if i == len(children):
-                    break
-                start = children[i-1].extent.end
-
-
-            r = cindex.SourceRange.from_locations(start, end)
-            f = open(cursor.location.file.name)
-            f.seek(start.offset)
-            length = end.offset-start.offset
-            data = f.read(length)
-            f.close()
-            self.const = re.search(r"\s*const\s*(=\s*0)?$", data) != None
-
-            if len(children) > 0 and children[0].kind != cindex.CursorKind.PARM_DECL:
-                f = open(cursor.location.file.name)
-                f.seek(cursor.extent.start.offset)
-                length = children[0].extent.start.offset-cursor.extent.start.offset
-                data = f.read(length)
-                f.close()
-                data = re.sub(r"%s.*" % self.name, "", data)
-                self.return_type.const = re.search(r"\s*const\s*$", data) != None
+            self.const = is_const_method(cursor, children)
+            const = bool(is_const_type(cursor.result_type))
+        self.return_type = use_type(cursor.result_type, const)
         self.asname()
-        if mir or mer:
-            pn = self.pretty_name()
-            if mer and mer.search(pn):
-                raise Exception("Function matches exclusion pattern. %s" % pn)
-            if mir and not mir.search(pn):
-                raise Exception("Function does not match inclusion pattern. %s" % pn)
 
     def uses(self, typename):
         if self.return_type.resolved == typename:
@@ -390,13 +810,19 @@ class Function(object):
         return False
 
     def pretty_name(self):
-        cargs =  ", ".join([t.get_c_type() for t in self.args])
-        if self.clazz:
-            return "%s %s::%s(%s)" % (self.return_type, self.clazz, self.name, cargs)
-        else:
-            return "%s %s(%s)" % (self.return_type, self.name, cargs)
+        key = ("pretty_name", self.name, self.clazz)
+        if key not in self.names:
+            cargs =  ", ".join([t.get_c_type() for t in self.args])
+            if self.clazz:
+                self.names[key] = "%s %s::%s(%s)" % (self.return_type, self.clazz, self.name, cargs)
+            else:
+                self.names[key] = "%s %s(%s)" % (self.return_type, self.name, cargs)
+        return self.names[key]
 
     def asname(self):
+        key = ("asname", self.name, self.clazz, self.behaviour)
+        if key in self.names:
+            return self.names[key]
         name = self.name
         if "operator" in name:
             if name not in operatornamedict:
@@ -462,6 +888,34 @@ class Function(object):
         if self.clazz and self.const:
             name += " const"
 
+        if types_resolved:
+            # Whether types are reference types may change until all the
+            # declarations are known
+            self.names[("asname", self.name, self.clazz, self.behaviour)] = name
+        return name
+
+    def generic_name(self):
+        key = ("generic_name", self.name, self.clazz)
+        if key not in self.names:
+            name = self.name
+            if "operator" in name:
+                name = operatornamedict[name]
+            name = name.replace("~", "tilde") + "_generic"
+            for arg in self.args:
+                name += "_" + mangle(arg.get_c_type())
+            if self.clazz:
+                name = self.clazz + "_" + name
+            self.names[key] = name
+        return self.names[key]
+
+    def trampoline_name(self):
+        # The name of the trampoline shared by every function with the same
+        # signature as this one
+        name = "generic_%s_%s" % ("method" if self.clazz else "function", mangle(self.return_type.get_c_type()))
+        for arg in self.args:
+            name += "_" + mangle(arg.get_c_type())
+        if self.const:
+            name += "_const"
         return name
 
     def get_generic(self):
@@ -476,17 +930,13 @@ class Function(object):
             "int8": "Byte",
             "bool": "Byte"
         }
-        name = self.name
-        if "operator" in name:
-            name = operatornamedict[name]
-        name = name.replace("~", "tilde") + "_generic"
-        for arg in self.args:
-            name += "_" + arg.get_c_type().replace("&", "amp").replace("*", "star").replace(" ", "space").replace(":", "colon")
-        if self.clazz:
-            name = self.clazz + "_" + name
-        func = "void %s(asIScriptGeneric *gen)\n{\n" % name
         asret = self.return_type.get_as_type()
-        call = "%s(" % self.name
+        cargs = ", ".join([arg.get_c_type() for arg in self.args])
+        # Plain calls go through a trampoline taking the callee as a template
+        # argument, so that it can be shared by every function whose wrapper
+        # would only differ in what it calls. Functions that can't be template
+        # arguments get a wrapper of their own.
+        template = None
         if self.clazz:
             if is_reference_type(self.clazz) and self.behaviour == "asBEHAVE_CONSTRUCT":
                 self.behaviour = "asBEHAVE_FACTORY"
@@ -495,8 +945,22 @@ class Function(object):
                 call = "gen->SetReturnAddress(new %s(" % (self.name)
             elif self.behaviour == "asBEHAVE_CONSTRUCT":
                 call = "new(gen->GetObject()) %s(" % self.name
+            elif self.behaviour == "asBEHAVE_DESTRUCT" or not self.shares_wrapper:
+                call = "static_cast<%s*>(gen->GetObject())->%s(" % (self.clazz, self.name)
             else:
-                call = "static_cast<%s*>(gen->GetObject())->%s" % (self.clazz, call)
+                # Inherited methods are called through a pointer to the
+                # method of the class declaring them
+                owner = self.member.clazz if isinstance(self, Inherited) else self.clazz
+                const = " const" if self.const else ""
+                template = "template<class Obj_, class Decl_, %s (Decl_::*Func_)(%s)%s>" % (self.return_type.get_c_type(), cargs, const)
+                callee = "%s, %s, &%s::%s" % (self.clazz, owner, owner, self.name)
+                call = "(static_cast<Obj_*>(gen->GetObject())->*Func_)("
+        elif not self.shares_wrapper:
+            call = "%s(" % self.name
+        else:
+            template = "template<%s (*Func_)(%s)>" % (self.return_type.get_c_type(), cargs)
+            callee = "&%s" % self.name
+            call = "Func_("
 
         for i in range(len(self.args)):
             if i > 0:
@@ -517,31 +981,42 @@ class Function(object):
         if self.behaviour == "asBEHAVE_FACTORY":
             call += ")"
 
+        body = ""
         asret2 = asret.replace("const ", "").strip()
         if asret2 in lut:
-            func += "\tgen->SetReturn%s(%s);\n" % (lut[asret2], call)
+            body += "\tgen->SetReturn%s(%s);\n" % (lut[asret2], call)
         elif asret == "void":
-            func += "\t" + call + ";\n"
+            body += "\t" + call + ";\n"
         else:
             ct = self.return_type.get_c_type()
             pt = "*" in ct
             star = "*" if not pt else ""
             if pt:
-                func += "\tgen->SetReturnAddress(%s);\n" % (call)
+                body += "\tgen->SetReturnAddress(%s);\n" % (call)
             elif "&" in ct:
-                func += "\tgen->SetReturnAddress((void*)&%s);\n" % (call)
+                body += "\tgen->SetReturnAddress((void*)&%s);\n" % (call)
             else:
 
-                func += "\t" + self.return_type.get_c_type().replace("&", "").replace("const ", "") + " ret = %s;\n" % call
-                func += "\tgen->SetReturnObject(&ret);\n"
+                body += "\t" + self.return_type.get_c_type().replace("&", "").replace("const ", "") + " ret = %s;\n" % call
+                body += "\tgen->SetReturnObject(&ret);\n"
 
-                #func += "\t" + self.return_type.get_c_type() + " ret = %s;\n" % call
-                #func += "\tnew(gen->GetAddressOfReturnLocation()) %s(ret);\n" % self.return_type.get_c_type().replace("&", "")
-        func += "}\n"
-        if func not in generic_wrappers:
-            generic_wrappers.append(func)
+                #body += "\t" + self.return_type.get_c_type() + " ret = %s;\n" % call
+                #body += "\tnew(gen->GetAddressOfReturnLocation()) %s(ret);\n" % self.return_type.get_c_type().replace("&", "")
+        body += "}\n"
 
-        return "asFUNCTION(%s), asCALL_GENERIC" % (name)
+        if template is None:
+            name = self.generic_name()
+            generic_wrappers.setdefault((name, body), name)
+            return "asFUNCTION(%s), asCALL_GENERIC" % (name)
+
+        key = (template, body)
+        if key not in generic_wrappers:
+            name = self.trampoline_name()
+            while name in generic_wrapper_names:
+                name += "_"
+            generic_wrapper_names.add(name)
+            generic_wrappers[key] = name
+        return "asFUNCTION((%s<%s>)), asCALL_GENERIC" % (generic_wrappers[key], callee)
 
 
     def get_register_string(self):
@@ -569,22 +1044,77 @@ class Function(object):
                 name = self.asname()
                 return _assert("engine->RegisterObjectBehaviour(\"%s\", %s, \"%s\", %s);" % (self.clazz, self.behaviour, name, call))
 
-def is_pure_virtual(cursor):
-    children = cursor.get_children()
-    start = cursor.extent.start
-    end = cursor.extent.end
-    while len(children) != 0:
-        child = children[-1]
-        children = child.get_children()
-        start = child.extent.end
-
-    f = open(cursor.location.file.name)
-    f.seek(start.offset)
-    length = end.offset-start.offset
-    data = f.read(length)
-    f.close()
+# The function_key of each function left out by the method regular
+# expressions, so that merge can tell how many different ones there were
+filtered_functions = []
+
+def admit_function(cursor, clazz=None, children=None, behaviour=None):
+    # Decides whether a Function should be built for cursor at all. What
+    # can be told from the name alone is checked first, then the pretty name
+    # is matched against the method regular expressions. The pretty name is
+    # built the same way as Function.pretty_name, but without creating any
+    # types. Functions that are filtered out are only recorded.
+    name = cursor.spelling
+    if "operator" in name:
+        if clazz is None:
+            raise Exception("Non member operator functions not supported currently")
+        if name not in operatornamedict:
+            raise Exception("Operator not supported in AngelScript %s::%s" % (clazz, name))
+    if not mir and not mer:
+        return True
+
+    if children is None:
+        children = cursor.get_children()
+    cargs = []
+    for child in children:
+        if child.kind == cindex.CursorKind.PARM_DECL:
+            cargs.append("%s%s" % ("const " if is_const(child) else "", get_type(child.type)))
+    cargs = ", ".join(cargs)
+    if clazz:
+        pn = "%s %s::%s(%s)" % (get_type(cursor.result_type), clazz, name, cargs)
+    else:
+        pn = "%s %s(%s)" % (get_type(cursor.result_type), name, cargs)
+    if (mer and mer.search(pn)) or (mir and not mir.search(pn)):
+        filtered_functions.append((cursor.get_usr() or pn, clazz, behaviour))
+        return False
+    return True
+
+def get_members(cursor):
+    # Returns the children of cursor along with the children of each of
+    # them, using a single traversal
+    members = []
+    for depth, parent, child in cursor.get_descendants(prune=lambda depth, parent, child: depth == 2):
+        if depth == 1:
+            members.append((child, []))
+        else:
+            members[-1][1].append(child)
+    return members
 
-    return re.search(r"=\s*0\s*$", data) != None
+pure_virtuals = {}
+
+def is_pure_virtual(cursor):
+    if cursor in pure_virtuals:
+        return pure_virtuals[cursor]
+    pure = cursor.get_cxxmethod_is_pure_virtual()
+    if pure is None:
+        pure = False
+        if cursor.get_cxxmethod_is_virtual():
+            # Older versions of libclang can't tell, so look for a trailing "= 0"
+            tokens, (start, stop) = get_tokens(cursor.extent)
+            pure = stop - start >= 2 and tokens.spellings(stop - 2, stop) == ["=", "0"]
+    pure_virtuals[cursor] = pure
+    return pure
+
+# The names and fields of base classes, keyed by the class declaration, as
+# a class is usually derived from more than once
+parent_names = {}
+parent_fields = {}
+
+def get_parent_name(cursor):
+    decl = cursor.get_reference()
+    if decl not in parent_names:
+        parent_names[decl] = decl.get_resolved_cursor().spelling
+    return parent_names[decl]
 
 
 objectindex = 0
@@ -592,13 +1122,17 @@ class ObjectType:
     def add_fields(self, children, array):
         for child in children:
             if child.kind == cindex.CursorKind.CXX_BASE_SPECIFIER:
-                self.add_fields(child.get_reference().get_children(), array)
+                decl = child.get_reference()
+                if decl not in parent_fields:
+                    parent_fields[decl] = []
+                    self.add_fields(decl.get_children(), parent_fields[decl])
+                array.extend(parent_fields[decl])
             if child.kind == cindex.CursorKind.FIELD_DECL:
                 array.append(child)
 
-    def __init__(self, cursor, children, name):
+    def __init__(self, cursor, members, name):
         global objectindex
-        self.cursor = cursor
+        self.usr = cursor.get_usr()
         self.name = name
         self.flags = {"asOBJ_APP_CLASS": True}
         fields = []
@@ -609,29 +1143,24 @@ class ObjectType:
 
         idx = cindex.CXXAccessSpecifier.PRIVATE if cursor.kind == cindex.CursorKind.CLASS_DECL else cindex.CXXAccessSpecifier.PUBLIC
         access = cindex._cxx_access_specifiers[idx]
-        for child in children:
+        for child, grandchildren in members:
 
             if child.kind == cindex.CursorKind.CXX_BASE_SPECIFIER:
-                c = child.get_resolved_cursor()
-                parentname = c.spelling
+                parentname = get_parent_name(child)
+                # parents holds every ancestor once, the ancestors of each
+                # base coming before the base itself
+                ancestors = [parentname]
                 if parentname in objecttypes:
-                    ot = objecttypes[parentname]
-                    self.parents.extend(ot.parents)
-                self.parents.append(parentname)
-                toadd = []
-                for om in objectmethods:
-                    if om.clazz == parentname:
-                        f = copy.deepcopy(om)
-                        f.clazz = self.name
-                        toadd.append(f)
-                objectmethods.extend(toadd)
-                toadd = []
-                for of in objectfields:
-                    if of.clazz == parentname:
-                        f = copy.deepcopy(of)
-                        f.clazz = self.name
-                        toadd.append(f)
-                objectfields.extend(toadd)
+                    ancestors = objecttypes[parentname].parents + ancestors
+                for p in ancestors:
+                    if p not in self.parents:
+                        self.parents.append(p)
+                for i in list(class_methods.get(parentname, {}).values()):
+                    f = InheritedFunction(objectmethods[i], self.name)
+                    add_member(objectmethods, class_methods, f, f.pretty_name())
+                for i in list(class_fields.get(parentname, {}).values()):
+                    f = InheritedField(objectfields[i], self.name)
+                    add_member(objectfields, class_fields, f, f.name)
                 continue
 
             if child.kind == cindex.CursorKind.CXX_ACCESS_SPEC_DECL:
@@ -648,7 +1177,9 @@ class ObjectType:
                     warn("Skipping member method %s::%s as it's static" % (self.name, child.spelling))
                     continue
                 try:
-                    objectmethods.append(Function(child, self.name))
+                    if admit_function(child, self.name, grandchildren):
+                        f = Function(child, self.name, children=grandchildren)
+                        add_member(objectmethods, class_methods, f, f.pretty_name())
                 except Exception as e:
                     warn("Skipping member method %s::%s - %s" % (self.name, child.spelling, e))
                 if is_pure_virtual(child):
@@ -656,27 +1187,28 @@ class ObjectType:
             elif child.kind == cindex.CursorKind.CONSTRUCTOR:
                 self.flags["asOBJ_APP_CLASS_CONSTRUCTOR"] = True
                 try:
-                    f = Function(child, self.name, "asBEHAVE_CONSTRUCT")
-                    behaviours.append(f)
+                    if admit_function(child, self.name, grandchildren, "asBEHAVE_CONSTRUCT"):
+                        f = Function(child, self.name, "asBEHAVE_CONSTRUCT", grandchildren)
+                        behaviours.append(f)
                 except Exception as e:
                     warn("Skipping constructor %s::%s - %s" % (self.name, child.spelling, e))
             elif child.kind == cindex.CursorKind.DESTRUCTOR:
                 self.flags["asOBJ_APP_CLASS_DESTRUCTOR"] = True
                 try:
-                    f = Function(child, self.name, "asBEHAVE_DESTRUCT")
-                    behaviours.append(f)
+                    if admit_function(child, self.name, grandchildren, "asBEHAVE_DESTRUCT"):
+                        f = Function(child, self.name, "asBEHAVE_DESTRUCT", grandchildren)
+                        behaviours.append(f)
                 except Exception as e:
                     warn("Skipping destructor %s::%s - %s" % (self.name, child.spelling, e))
             elif child.kind == cindex.CursorKind.FIELD_DECL:
                 try:
-                    type = Type(child.type)
-                    objectfields.append(ObjectField(self.name, child.spelling, type))
+                    type = use_type(child.type)
+                    f = ObjectField(self.name, child.spelling, type, child.get_usr())
+                    add_member(objectfields, class_fields, f, f.name)
                 except Exception as e:
                     warn("Skipping member field %s::%s - %s" % (self.name, child.spelling, e))
             elif child.kind == cindex.CursorKind.TYPEDEF_DECL:
-                name, kind = get_typedef(child)
-                if name:
-                    typedef[name] = kind
+                add_typedef(child)
                 warn("Typedefs within classes is not supported by AngelScript")
             else:
                 warn("Unhandled cursor: %s, %s" % (child.displayname, child.kind))
@@ -684,14 +1216,14 @@ class ObjectType:
             self.flags["asOBJ_POD"] = True
 
 
-        self.add_fields(children, fields)
+        self.add_fields([member[0] for member in members], fields)
         if len(fields):
             try:
                 child = fields.pop(0)
-                t = get_real_type(get_type(child.type, child))
+                t = get_field_type(child)
                 allEqual = True
                 for field in fields:
-                    t2 = get_real_type(get_type(field.type, field))
+                    t2 = get_field_type(field)
                     if t2 != t:
                         break
                 if allEqual:
@@ -706,15 +1238,15 @@ class ObjectType:
                 pass
 
     def get_flags(self):
+        if self.name in object_flags:
+            return object_flags[self.name]
         flags = [] if is_reference_type(self.name) else list(self.flags)
-        if "object_types" in config:
-            for regex in config["object_types"]:
-                if regex.search(self.name):
-                    conf = config["object_types"][regex]
-                    if "flags" in conf:
-                        flags = conf["flags"]
-                    if "extra_flags" in conf:
-                        flags.extend(conf["extra_flags"])
+        for regex, conf in get_object_rules(self.name):
+            if "flags" in conf:
+                # Copied, as the list is modified below
+                flags = list(conf["flags"])
+            if "extra_flags" in conf:
+                flags.extend(conf["extra_flags"])
 
         if not is_reference_type(self.name):
             if "asOBJ_NOCOUNT" in flags:
@@ -742,7 +1274,7 @@ class ObjectType:
             f.const = False
             t = cindex.Type(cindex.TypeKind.VOID.from_param())
             f.behaviour = "asBEHAVE_ADDREF"
-            f.return_type = Type(t)
+            f.return_type = use_type(t)
             behaviours.append(f)
 
             f = copy.deepcopy(f)
@@ -755,10 +1287,12 @@ class ObjectType:
 
 
 class ObjectField:
-    def __init__(self, clazz, name, type):
+    def __init__(self, clazz, name, type, usr=None):
         self.clazz = clazz
         self.name = name
         self.type = type
+        self.usr = usr
+        self.names = {}
         pn = self.pretty_name()
         if mfer and mfer.search(pn):
             raise Exception("Matches exclude pattern")
@@ -770,11 +1304,54 @@ class ObjectField:
         return self.type.resolved == typename
 
     def pretty_name(self):
-        return "%s %s::%s" % (self.type, self.clazz, self.name)
+        key = ("pretty_name", self.name, self.clazz)
+        if key not in self.names:
+            self.names[key] = "%s %s::%s" % (self.type, self.clazz, self.name)
+        return self.names[key]
 
     def get_register_string(self):
         return _assert("engine->RegisterObjectProperty(\"%s\", \"%s %s\", asOFFSET(%s,%s));" % (self.clazz, self.type, self.name, self.clazz, self.name))
 
+class Inherited(object):
+    # A member inherited from a base class. Everything but the class it
+    # belongs to is shared with the member of the base class, including its
+    # types and arguments, which are never copied.
+    def __init__(self, member, clazz):
+        if isinstance(member, Inherited):
+            member = member.member
+        self.__dict__.update(member.__dict__)
+        self.member = member
+        self.clazz = clazz
+        self.names = {}
+
+class InheritedFunction(Inherited, Function):
+    pass
+
+class InheritedField(Inherited, ObjectField):
+    pass
+
+# The members of each class, mapping their signatures to where they are in
+# objectmethods and objectfields
+class_methods = {}
+class_fields  = {}
+
+def add_member(members, index, member, signature):
+    # Inherited members come first, as base classes are listed before the
+    # members of a class. A member inheriting the signature of another
+    # inherited member is dropped, and a member declared by the class itself
+    # takes the place of the inherited member it overrides.
+    signatures = index.setdefault(member.clazz, collections.OrderedDict())
+    if signature in signatures:
+        i = signatures[signature]
+        if isinstance(member, Inherited):
+            return
+        if isinstance(members[i], Inherited):
+            members[i] = member
+            return
+    else:
+        signatures[signature] = len(members)
+    members.append(member)
+
 typedefs      = []
 enums         = []
 objecttypes   = {}
@@ -783,6 +1360,13 @@ objectmethods = []
 objectfields  = []
 includes      = []
 behaviours     = []
+# The generic wrappers, keyed by their template header (or their name, for
+# those that are not templates) and body, mapping to their names
+generic_wrappers = collections.OrderedDict()
+generic_wrapper_names = set()
+
+def mangle(ctype):
+    return ctype.replace("&", "amp").replace("*", "star").replace(" ", "space").replace(":", "colon")
 
 def _assert(line):
     if doassert:
@@ -792,22 +1376,23 @@ def _assert(line):
 
 
 def get_typedef(cursor):
-    tokens = cindex.tokenize(tu, cursor.extent)
+    tokens, (start, stop) = get_tokens(cursor.extent)
     good = True
-    if len(tokens) >= 4:
-        for x in tokens[1:-2]:
-            if x.kind != cindex.TokenKind.IDENTIFIER and x.kind != cindex.TokenKind.KEYWORD:
+    if stop - start >= 3:
+        for x in tokens.kinds(start + 1, stop - 1):
+            if x != cindex.TokenKind.IDENTIFIER and x != cindex.TokenKind.KEYWORD:
                 good = False
                 break
     else:
         good = False
     if good:
-        kind = " ".join([t.spelling for t in tokens[1:len(tokens)-2]])
-        name = tokens[len(tokens)-2].spelling
+        kind = " ".join(tokens.spellings(start + 1, stop - 1))
+        name = tokens.spelling(stop - 1)
     else:
         data = ""
-        for token in tokens:
-            data += token.spelling + " "
+        if tokens is not None:
+            for spelling in tokens.spellings(start, stop):
+                data += spelling + " "
         return None, data
     return name, kind
 
@@ -815,46 +1400,68 @@ def add_include(filename):
     if not filename in includes and filename.endswith(".h"):
         includes.append(filename)
 
+def admit_file(filename):
+    if fer and fer.search(filename):
+        return None
+    if fir and not fir.search(filename):
+        return None
+    return filename
+
+def get_admitted_files(tu):
+    # Maps the CXFile pointer of each file to its name if declarations in it
+    # are to be processed, or to None if they are not, so that the regular
+    # expressions are only run once per file rather than once per declaration.
+    admitted = {}
+    for inc in tu.get_includes():
+        f = inc.include
+        if hash(f) not in admitted:
+            admitted[hash(f)] = admit_file(f.name)
+    return admitted
+
 def walk(cursor):
     global typedefs
     global enums
     global objecttypes
     global functions
     global objectmethods
+    global current_decl
+    admitted = get_admitted_files(tu)
     for child in cursor.get_children():
-        if not child.location.file:
+        f = child.get_file_pointer()
+        if not f:
             continue
-        filename = child.location.file.name
-        if child.kind == cindex.CursorKind.TYPEDEF_DECL:
-            name, kind = get_typedef(child)
-            if name:
-                typedef[name] = kind
-
-        if fer and fer.search(filename):
-            continue
-        if fir and not fir.search(filename):
+        if f in admitted:
+            filename = admitted[f]
+        else:
+            filename = admitted[f] = admit_file(child.location.file.name)
+        if filename is None:
+            if child.kind == cindex.CursorKind.TYPEDEF_DECL:
+                # Only resolved if a declaration that is processed uses it
+                add_typedef(child)
             continue
+        current_decl = child.get_usr()
 
         if child.kind == cindex.CursorKind.MACRO_DEFINITION:
-            tokens = cindex.tokenize(tu, child.extent)
-            if tokens[0].kind == cindex.TokenKind.IDENTIFIER and tokens[1].kind == cindex.TokenKind.LITERAL and is_int(tokens[1].spelling):
-                define = _assert("engine->RegisterEnumValue(\"HASH_DEFINES\", \"%s\", %s);" % (tokens[0].spelling, tokens[1].spelling))
+            tokens, (start, stop) = get_tokens(child.extent)
+            if stop - start < 2:
+                continue
+            kinds = tokens.kinds(start, start + 2)
+            if kinds[0] == cindex.TokenKind.IDENTIFIER and kinds[1] == cindex.TokenKind.LITERAL and is_int(tokens.spelling(start + 1)):
+                define = _assert("engine->RegisterEnumValue(\"HASH_DEFINES\", \"%s\", %s);" % (tokens.spelling(start), tokens.spelling(start + 1)))
                 if define not in enums:
                     enums.append(define)
         elif child.kind == cindex.CursorKind.FUNCTION_DECL:
             try:
-                f = Function(child)
-                if "operator" in f.name:
-                    raise Exception("Non member operator functions not supported currently")
-                else:
-                    functions.append(f)
-                add_include(filename)
+                children = child.get_children()
+                if admit_function(child, children=children):
+                    functions.append(Function(child, children=children))
+                    add_include(filename)
             except Exception as e:
                 warn("Skipping function %s - %s" % (child.spelling, e))
         elif child.kind == cindex.CursorKind.TYPEDEF_DECL:
             name, kind = get_typedef(child)
             if name:
-                typedef[name] = kind
+                set_typedef(name, kind)
                 if get_real_type(kind) not in as_builtins:
                     warn("Typedef %s = %s can't be registered as it doesn't resolve to an AngelScript builtin type" % (name, kind))
                 else:
@@ -862,8 +1469,8 @@ def walk(cursor):
             else:
                 warn("Typedef too complex, skipping: %s" % name)
         elif child.kind == cindex.CursorKind.CLASS_DECL or child.kind == cindex.CursorKind.STRUCT_DECL:
-            children = child.get_children()
-            if len(children) == 0:
+            members = get_members(child)
+            if len(members) == 0:
                 continue
 
             if oer and oer.search(child.spelling):
@@ -881,7 +1488,7 @@ def walk(cursor):
                 # TODO: different namespaces
                 warn("Skipping type %s, as it is already defined" % classname)
 
-            o = ObjectType(child, children, classname)
+            o = ObjectType(child, members, classname)
 
             objecttypes[classname] = o
             add_include(filename)
@@ -895,22 +1502,21 @@ def walk(cursor):
 
 
 
-# Removes usage of object types that are used both as a reference and a value type
-def mismatch_filter(source, toremove):
-    toadd =source
-    ret = []
-    while len(toadd):
-        curr = toadd.pop(0)
-        if curr.uses(toremove):
-            warn("\t%s" % curr.pretty_name())
-        else:
-            ret.append(curr)
-    return ret
+# The functions, methods and behaviours using each resolved type name, in the
+# order they are registered in
+type_users = {}
 
-def remove_ref_val_mismatches():
-    global functions
-    global objectmethods
-    global behaviours
+def add_type_users(source):
+    for f in source:
+        for t in [f.return_type] + f.args:
+            users = type_users.setdefault(t.resolved, [])
+            if len(users) == 0 or users[-1] is not f:
+                users.append(f)
+
+# Finds the users of object types that are used both as a reference and a
+# value type. Returns the ids of the functions to remove.
+def find_ref_val_mismatches():
+    removed = set()
     for key in objecttype_scoreboard:
         isref = is_reference_type(key)
         ref, val = objecttype_scoreboard[key]
@@ -919,119 +1525,311 @@ def remove_ref_val_mismatches():
         warn("\"%s\" is used both as a reference type (%d) and a value type (%d). The following will be removed:" % (key, ref, val))
         toremove = "%s%s" % (key, "*" if not isref else "")
 
-        functions = mismatch_filter(functions, toremove)
-        objectmethods = mismatch_filter(objectmethods, toremove)
-        behaviours = mismatch_filter(behaviours, toremove)
-
-
-
-
-def unknown_filter(source):
-    toadd = source
-    ret = []
-    while len(toadd):
-        keep = True
-        curr = toadd.pop(0)
+        for f in type_users.get(toremove, []):
+            if id(f) not in removed:
+                warn("\t%s" % f.pretty_name())
+                removed.add(id(f))
+    return removed
+
+# Each post processing filter creates a check for one list. A check returns
+# None to keep a function, or why it is removed. The reason is given as a
+# warning unless it is empty.
+def mismatch_filter(mismatched):
+    def check(curr):
+        if id(curr) in mismatched:
+            return ""
+        return None
+    return lambda: check
+
+def unknown_filter():
+    def check(curr):
         broken = None
         for t in curr.args:
             if not t.is_known():
                 broken = t.resolved
-                keep = False
         if not curr.return_type.is_known():
             broken = curr.return_type.resolved
-            keep = False
-        if not keep:
-            warn("Removing %s as it's using an unknown type %s [disable with -ku]" % (curr.pretty_name(), broken))
+        if broken is not None:
+            return "Removing %s as it's using an unknown type %s [disable with -ku]" % (curr.pretty_name(), broken)
+        return None
+    return check
+
+def dup_filter():
+    names = set()
+    def check(curr):
+        pn = curr.pretty_name()
+        if pn in names:
+            return "Removing duplicate function %s" % pn
+        names.add(pn)
+        return None
+    return check
+
+def reference_destructor_filter():
+    def check(curr):
+        if curr.behaviour == "asBEHAVE_DESTRUCT" and is_reference_type(curr.clazz):
+            return "Removing destructor for reference type %s" % curr.clazz
+        return None
+    return check
+
+def pure_virtual_constructor_filter():
+    def check(curr):
+        if curr.behaviour != "asBEHAVE_CONSTRUCT" and curr.behaviour != "asBEHAVE_FACTORY":
+            return None
+        if curr.clazz in objecttypes and objecttypes[curr.clazz].has_pure_virtuals:
+            return "Removing constructor for type %s which has pure virtual members" % curr.clazz
+        return None
+    return check
+
+def filter_functions(source, checks, counts, reasons):
+    # Runs every check on each function in a single pass, stopping at the
+    # first one that removes it
+    ret = []
+    for curr in source:
+        for i in range(len(checks)):
+            reason = checks[i](curr)
+            if reason is not None:
+                counts[i] += 1
+                if reason:
+                    reasons[i].append(reason)
+                break
         else:
             ret.append(curr)
     return ret
 
-def remove_unknowns():
-    global functions
-    global objectmethods
-    global behaviours
-
-    functions = unknown_filter(functions)
-    objectmethods = unknown_filter(objectmethods)
-    behaviours = unknown_filter(behaviours)
-
+def reset():
+    global typedefs, enums, objecttypes, functions, objectmethods, objectfields
+    global includes, behaviours, generic_wrappers, generic_wrapper_names
+    global filtered_functions, typedef, typedef_cursors, objecttype_scoreboard, decl_uses, current_decl, objectindex
+    global file_tokens, last_tokens
+    global type_names, type_records, pure_virtuals, parent_names, parent_fields
+    global reference_types, object_flags, types_resolved, class_methods, class_fields
+    global type_users
+
+    typedefs      = []
+    enums         = []
+    objecttypes   = {}
+    functions     = []
+    objectmethods = []
+    objectfields  = []
+    includes      = []
+    behaviours     = []
+    generic_wrappers = collections.OrderedDict()
+    generic_wrapper_names = set()
+    filtered_functions = []
+    typedef = {}
+    typedef_cursors = {}
+    objecttype_scoreboard = {}
+    decl_uses = {}
+    current_decl = None
+    objectindex = 0
+    file_tokens = {}
+    last_tokens = None
+    type_names = {}
+    type_records = {}
+    pure_virtuals = {}
+    parent_names = {}
+    parent_fields = {}
+    reference_types = {}
+    object_flags = {}
+    types_resolved = False
+    class_methods = {}
+    class_fields = {}
+    type_users = {}
+
+def extract(translation_unit):
+    global tu
+    reset()
+    tu = translation_unit
+    walk(tu.cursor)
+    return {
+        "typedefs": typedefs,
+        "enums": enums,
+        "objecttypes": objecttypes,
+        "functions": functions,
+        "objectmethods": objectmethods,
+        "objectfields": objectfields,
+        "includes": includes,
+        "behaviours": behaviours,
+        "typedef": typedef,
+        "decl_uses": decl_uses,
+        "filtered_functions": filtered_functions,
+        "diagnostics": get_diagnostics(tu)
+    }
 
-def dup_filter(source):
-    toadd = source
-    ret = []
-    names = []
-    while len(toadd):
-        keep = True
-        curr = toadd.pop(0)
-        pn = curr.pretty_name()
-        if pn in names:
-            warn("Removing duplicate function %s" % pn)
+def get_batches(filenames, options):
+    # Configurations that compile the same translation units are put in the
+    # same batch, so that each translation unit is only parsed once
+    batches = []
+    keys = {}
+    for filename in filenames:
+        load_config(filename, options)
+        arg_sets = get_translation_units()
+        key = tuple([(tuple(args), repr(get_unsaved_files(args))) for args in arg_sets])
+        if key in keys:
+            keys[key]["configs"].append(filename)
         else:
-            ret.append(curr)
-            names.append(pn)
-    return ret
+            keys[key] = {"configs": [filename], "arg_sets": arg_sets}
+            batches.append(keys[key])
+    return batches
 
-def remove_duplicates():
+def extract_configs(filenames, options, translation_unit):
+    # Returns one model per configuration. Any warnings given so far
+    # are counted towards the first configuration.
+    global warn_count
+    models = []
+    for filename in filenames:
+        load_config(filename, options)
+        model = extract(translation_unit)
+        model["warn_count"] = warn_count
+        warn_count = 0
+        models.append(model)
+    return models
+
+def extract_worker(task):
+    global warn_count
+    filenames, options, args = task
+    # The translation unit is parsed with the settings of the first configuration
+    load_config(filenames[0], options)
+    warn_count = 0
+    return extract_configs(filenames, options, parse(args))
+
+def merge_unique(target, source, key, known):
+    # Declarations already seen in a previous translation unit are skipped,
+    # but anything repeated within the same one is kept as is.
+    added = set()
+    for item in source:
+        k = key(item)
+        if k not in known:
+            target.append(item)
+            added.add(k)
+    known.update(added)
+
+def function_key(f):
+    return (f.usr or f.pretty_name(), f.clazz, f.behaviour)
+
+def field_key(f):
+    return (f.usr or f.name, f.clazz)
+
+def merge(models):
+    global objectindex
+    reset()
+    known = {}
+    for name in ["typedefs", "enums", "includes", "functions", "objectmethods", "objectfields", "behaviours", "objecttypes", "decl_uses", "filtered_functions"]:
+        known[name] = set()
+
+    for model in models:
+        merge_unique(typedefs, model["typedefs"], lambda t: t, known["typedefs"])
+        merge_unique(enums, model["enums"], lambda e: e, known["enums"])
+        merge_unique(includes, model["includes"], lambda i: i, known["includes"])
+        merge_unique(functions, model["functions"], function_key, known["functions"])
+        merge_unique(objectmethods, model["objectmethods"], function_key, known["objectmethods"])
+        merge_unique(objectfields, model["objectfields"], field_key, known["objectfields"])
+        merge_unique(behaviours, model["behaviours"], function_key, known["behaviours"])
+        merge_unique(filtered_functions, model["filtered_functions"], lambda k: k, known["filtered_functions"])
+        typedef.update(model["typedef"])
+
+        ot = model["objecttypes"].values()
+        ot.sort(cmp=lambda a, b:  cmp(a.index, b.index))
+        added = set()
+        for o in ot:
+            if o.usr in known["objecttypes"]:
+                continue
+            if o.name in objecttypes:
+                # TODO: different namespaces
+                warn("Skipping type %s, as it is already defined" % o.name)
+            o.index = objectindex
+            objectindex += 1
+            objecttypes[o.name] = o
+            added.add(o.usr)
+        known["objecttypes"].update(added)
+
+        for usr in model["decl_uses"]:
+            if usr in known["decl_uses"]:
+                continue
+            for typename in model["decl_uses"][usr]:
+                count_use(typename)
+        known["decl_uses"].update(model["decl_uses"])
+    add_type_users(functions)
+    add_type_users(objectmethods)
+    add_type_users(behaviours)
+    # Names cached by a previous merge of the same declarations may no
+    # longer hold for the types merged this time
+    for member in functions + objectmethods + objectfields + behaviours:
+        member.names = {}
+    resolve_object_types()
+
+def postprocess():
     global functions
     global objectmethods
     global behaviours
 
-    functions = dup_filter(functions)
-    objectmethods = dup_filter(objectmethods)
-    behaviours = dup_filter(behaviours)
-
-
-def remove_reference_destructors():
-    global behaviours
-    toadd = behaviours
-    behaviours = []
-    while len(toadd):
-        curr = toadd.pop(0)
-        if is_reference_type(curr.clazz) and curr.behaviour == "asBEHAVE_DESTRUCT":
-            warn("Removing destructor for reference type %s" % curr.clazz)
-        else:
-            behaviours.append(curr)
-
-def remove_pure_virtual_constructors():
-    global behaviours
-    toadd = behaviours
-    behaviours = []
-    while len(toadd):
-        curr = toadd.pop(0)
-        virt = False
-        if curr.clazz in objecttypes:
-            virt = objecttypes[curr.clazz].has_pure_virtuals
-
-        if virt and (curr.behaviour == "asBEHAVE_CONSTRUCT" or curr.behaviour == "asBEHAVE_FACTORY"):
-            warn("Removing constructor for type %s which has pure virtual members" % curr.clazz)
+    filters = [("ref/value mismatches", mismatch_filter(find_ref_val_mismatches()))]
+    if not keep_unknowns:
+        filters.append(("unknown types", unknown_filter))
+    filters.append(("duplicates", dup_filter))
+    filters.append(("reference type destructors", reference_destructor_filter))
+    filters.append(("pure virtual constructors", pure_virtual_constructor_filter))
+
+    counts = [0] * len(filters)
+    reasons = [[] for f in filters]
+    functions = filter_functions(functions, [f() for name, f in filters], counts, reasons)
+    objectmethods = filter_functions(objectmethods, [f() for name, f in filters], counts, reasons)
+    behaviours = filter_functions(behaviours, [f() for name, f in filters], counts, reasons)
+
+    # Warnings are given filter by filter, as if each had been a pass of its own
+    for i in range(len(filters)):
+        for reason in reasons[i]:
+            warn(reason)
+        if verbose and counts[i]:
+            sys.stderr.write("Removed %d functions for %s\n" % (counts[i], filters[i][0]))
+
+def join_chunks(separator, strings):
+    # Yields the pieces of separator.join(strings) one at a time
+    first = True
+    for string in strings:
+        if not first:
+            yield separator
+        first = False
+        yield string
+
+def registration_chunks():
+    # The registration function, built one registration at a time. Building
+    # it is also what fills in generic_wrappers.
+    yield "void %s(asIScriptEngine* engine)\n{\n\tint r;\n\n\t" % funcname
+    ot = [objecttypes[o] for o in objecttypes]
+    ot.sort(cmp=lambda a, b:  cmp(a.index, b.index))
+    for chunk in join_chunks("\n\t", (o.get_register_string() for o in ot)):
+        yield chunk
+    yield "\n\t"
+    for chunk in join_chunks("\n\t", typedefs):
+        yield chunk
+    yield "\n\t"
+    yield "\n\t%s" % _assert("engine->RegisterEnum(\"HASH_DEFINES\");")
+    for chunk in join_chunks("\n\t", enums):
+        yield chunk
+    for members in (functions, behaviours, objectmethods, objectfields):
+        yield "\n\t"
+        for chunk in join_chunks("\n\t", (o.get_register_string() for o in members)):
+            yield chunk
+    yield "\n}\n"
+
+def wrapper_chunks():
+    for (header, body), name in generic_wrappers.iteritems():
+        if header != name:
+            yield "%s\nvoid %s(asIScriptGeneric *gen)\n{\n%s" % (header, name, body)
         else:
-            behaviours.append(curr)
-
-
-walk(tu.cursor)
+            yield "void %s(asIScriptGeneric *gen)\n{\n%s" % (name, body)
 
-# File processed, do some post processing
-remove_ref_val_mismatches()
+def header_chunks():
+    yield "#include <angelscript.h>\n#include <assert.h>\n\n"
 
-if not keep_unknowns:
-    remove_unknowns()
-remove_duplicates()
-remove_reference_destructors()
-remove_pure_virtual_constructors()
+    if len(includes):
+        yield "#include \""
+        for chunk in join_chunks("\"\n#include \"", includes):
+            yield chunk
+        yield "\""
 
-
-f = sys.stdout
-if output_filename != None:
-    output_filename = output_filename.replace("${this_file_path}", os.path.dirname(os.path.abspath(sys.argv[1])))
-    f = open(output_filename, "w")
-f.write("#include <angelscript.h>\n#include <assert.h>\n\n")
-
-if len(includes):
-    f.write("#include \"")
-    f.write("\"\n#include \"".join(includes))
-    f.write("\"")
-
-f.write("""
+    yield """
 template<class A, class B>
 B* refCast(A* a)
 {
@@ -1050,35 +1848,149 @@ B* refCast_nocount(A* a)
     if( !a ) return NULL;
     return dynamic_cast<B*>(a);
 }
-""")
-
-data  = "void %s(asIScriptEngine* engine)\n{\n\tint r;\n\n\t" % funcname
-ot = [objecttypes[o] for o in objecttypes]
-ot.sort(cmp=lambda a, b:  cmp(a.index, b.index))
-data += "\n\t".join([o.get_register_string() for o in ot])
-data += "\n\t"
-data += "\n\t".join(typedefs)
-data += "\n\t"
-data += "\n\t%s" % _assert("engine->RegisterEnum(\"HASH_DEFINES\");")
-data += "\n\t".join(enums)
-data += "\n\t"
-data += "\n\t".join([o.get_register_string() for o in functions])
-data += "\n\t"
-data += "\n\t".join([o.get_register_string() for o in behaviours])
-data += "\n\t"
-data += "\n\t".join([o.get_register_string() for o in objectmethods])
-data += "\n\t"
-data += "\n\t".join([o.get_register_string() for o in objectfields])
-data += "\n}\n"
-
-f.write("\n".join(generic_wrappers))
-f.write("\n\n")
-
-f.write(data)
-if output_filename != None:
-    f.close()
+"""
+
+    for chunk in join_chunks("\n", wrapper_chunks()):
+        yield chunk
+    yield "\n\n"
+
+def write_output():
+    # The generic wrappers go before the registration function, but are only
+    # known once it has been built, so it is spooled to a temporary file
+    # first. Nothing the size of the output is ever held in memory.
+    spool = tempfile.TemporaryFile("w+")
+    spool.writelines(registration_chunks())
+    spool.seek(0)
+
+    f = sys.stdout
+    if output_filename != None:
+        f = open(output_filename, "w", 1 << 16)
+    f.writelines(header_chunks())
+    shutil.copyfileobj(spool, f, 1 << 16)
+    spool.close()
+    if output_filename != None:
+        f.close()
+
+def generate(filename, options, models):
+    global warn_count
+    load_config(filename, options)
+    warn_count = sum([model["warn_count"] for model in models])
+    merge(models)
+    filtered = len(filtered_functions)
+
+    # File processed, do some post processing
+    postprocess()
+    write_output()
+
+    for model in models:
+        for diag in model["diagnostics"]:
+            warn("clang had the following to say: %s" % (diag))
+
+    if verbose and filtered:
+        sys.stderr.write("%d functions were left out by the method regular expressions\n" % filtered)
+    sys.stderr.write("Finished with %d warnings\n" % warn_count)
+
+def get_mtimes(files):
+    mtimes = []
+    for name in files:
+        try:
+            mtimes.append(os.path.getmtime(name))
+        except OSError:
+            mtimes.append(None)
+    return mtimes
+
+def watch_files(batches, options):
+    # Keeps the translation units around and reparses the ones whose
+    # files change, which is much cheaper than starting over.
+    count = 0
+    for batch in batches:
+        batch["files"] = [get_dependencies(tu) for tu in batch["tus"]]
+        batch["mtimes"] = [get_mtimes(f) for f in batch["files"]]
+        count += sum([len(f) for f in batch["files"]])
+    sys.stderr.write("Watching %d files for changes\n" % count)
+    while True:
+        time.sleep(0.5)
+        for batch in batches:
+            try:
+                update_batch(batch, options)
+            except Exception as e:
+                # Files may be caught half saved, so this is only reported and
+                # the translation unit parsed again once they change again
+                sys.stderr.write("Couldn't regenerate the bindings - %s\n" % e)
 
-for diag in tu.diagnostics:
-    warn("clang had the following to say: %s" % (diag.spelling))
+def update_batch(batch, options):
+    global warn_count
+    configs = batch["configs"]
+    tus = batch["tus"]
+    changed = False
+    for i in range(len(tus)):
+        current = get_mtimes(batch["files"][i])
+        if current == batch["mtimes"][i]:
+            continue
+        if not changed:
+            load_config(configs[0], options)
+            warn_count = 0
+            # Headers may have been added or removed since
+            umbrellas.clear()
+        changed = True
+        batch["mtimes"][i] = current
+        source, unsaved_files = get_unsaved_files(batch["arg_sets"][i])
+        if tus[i] is None or not tus[i].reparse(unsaved_files):
+            # Translation units loaded from the cache can't be reparsed, and
+            # those that failed to parse last time are gone
+            tus[i] = None
+            tus[i] = parse(batch["arg_sets"][i])
+        batch["files"][i] = get_dependencies(tus[i])
+        batch["mtimes"][i] = get_mtimes(batch["files"][i])
+    if changed and None not in tus:
+        # Every translation unit is extracted again, as generating
+        # the output changes the declarations in the models, and
+        # those of unchanged translation units depend on the others
+        for i in range(len(tus)):
+            models = extract_configs(configs, options, tus[i])
+            for j in range(len(configs)):
+                batch["models"][j][i] = models[j]
+        for j in range(len(configs)):
+            generate(configs[j], options, batch["models"][j])
+
+def main():
+    options = [arg for arg in sys.argv[1:] if arg.startswith("-")]
+    filenames = [arg for arg in sys.argv[1:] if not arg.startswith("-")]
+    if len(filenames) < 1:
+        print "usage: %s configfile.json [configfile2.json ...]" % sys.argv[0]
+        sys.exit(1)
+
+    filenames = get_config_files(filenames)
+    batches = get_batches(filenames, options)
+    tasks = [(batch["configs"], options, args) for batch in batches for args in batch["arg_sets"]]
+    load_config(filenames[0], options)
+    if len(tasks) > 1 and jobs > 1 and not watch:
+        # Each translation unit is parsed and extracted in a process of its own
+        pool = multiprocessing.Pool(min(jobs, len(tasks)))
+        results = pool.map(extract_worker, tasks)
+        pool.close()
+        pool.join()
+    else:
+        results = []
+        for batch in batches:
+            load_config(batch["configs"][0], options)
+            batch["tus"] = [parse(args) for args in batch["arg_sets"]]
+            for t in batch["tus"]:
+                results.append(extract_configs(batch["configs"], options, t))
+
+    # results has a list of models, one per configuration, for each translation unit
+    for batch in batches:
+        count = len(batch["arg_sets"])
+        batch["models"] = [[r[j] for r in results[:count]] for j in range(len(batch["configs"]))]
+        results = results[count:]
+        for j in range(len(batch["configs"])):
+            generate(batch["configs"][j], options, batch["models"][j])
+
+    if watch:
+        try:
+            watch_files(batches, options)
+        except KeyboardInterrupt:
+            pass
 
-sys.stderr.write("Finished with %d warnings\n" % warn_count)
+if __name__ == "__main__":
+    main()